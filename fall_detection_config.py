@@ -16,17 +16,28 @@ MQTT_TOPIC_STATUS = "fall/status"
 # Camera Settings
 CAMERA_RESOLUTION = (320, 240)
 SNAPSHOT_FOLDER = "snapshots"
+SNAPSHOT_FSYNC_EVERY = 5  # Snapshots written between fsyncs (spares the SD card during emergencies)
+STREAM_RESOLUTION = (320, 240)  # Live feed size, hardware-encoded from the lores stream (must not exceed CAMERA_RESOLUTION)
+JPEG_QUALITY = 70
+STREAM_FPS = 15  # Software JPEG encode rate for the live feed (when hardware MJPEG is unavailable)
 
 # AI Model Settings
 POSENET_MODEL_PATH = "posenet_mobilenet_v1_100_257x257_multi_kpt_stripped.tflite"
 YOLO_MODEL_PATH = "yolov8n.pt" # Placeholder for YOLO model path
 YOLO_POSE_MODEL_NAME = "yolov8n-pose.pt" # YOLOv8 model for pose estimation
 
+# Dashboard Settings
+SENSOR_HISTORY_LENGTH = 100  # Sensor messages kept in memory (oldest evicted first)
+EMIT_BATCH_INTERVAL = 0.1  # seconds (Window for coalescing system_update/motion_update into one event)
+STATE_KEYFRAME_INTERVAL = 1.0  # seconds (Min gap between full system_update payloads; deltas in between)
+
 # Fall Detection Settings
 ALERT_TIMEOUT = 30  # seconds (Overall timeout for alert escalation)
 EMERGENCY_TRIGGER_DURATION = 30 # seconds (How long person must be fallen AND motionless to trigger emergency)
 MOTION_THRESHOLD = 25  # OpenCV motion detection threshold
 MOTION_MIN_AREA = 500  # Minimum contour area to detect motion
+MOTION_FRAME_SIZE = (160, 120)  # Frames are downscaled to this before motion differencing
+MOTION_CHECK_INTERVAL = 1.0  # Seconds between generic motion checks while monitoring
 
 # WiFi Settings (for ESP32)
 WIFI_SSID = "ADU-STEAM"
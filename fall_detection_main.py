@@ -4,30 +4,97 @@ Fall Detection System - Main Application
 Receives data from ESP32, manages camera, serves web dashboard
 """
 
-import json
+# Must run before anything else imports socket/threading so they become cooperative
+import eventlet
+eventlet.monkey_patch()
+from eventlet import patcher
+
+# Unpatched stdlib for code that must stay on real OS threads
+native_threading = patcher.original('threading')
+native_queue = patcher.original('queue')
+NATIVE_MODULES = tuple((name, patcher.original(name)) for name in ('_thread', 'threading', 'queue', 'select', 'time'))
+
+def import_native(module_name):
+    """Import module_name bound to the unpatched threading/queue/select/time modules.
+
+    picamera2's encoder thread needs select.poll, which monkey_patch removes, and YOLO
+    inference on a green thread would block the whole server while it runs.
+    """
+    return patcher.import_patched(module_name, *NATIVE_MODULES)
+
+import atexit
+import copy
+import io
+import logging
+import logging.handlers
 import os
+import queue
+import sys
 import time
+from collections import deque
 from datetime import datetime
-from threading import Thread, Lock
+from threading import Lock, Condition, Event
 import cv2
+from eventlet import tpool
 import numpy as np
-from flask import Flask, render_template, jsonify, send_from_directory, Response
+import orjson
+from flask import Flask, render_template, send_from_directory, Response, request
 from flask_socketio import SocketIO, emit
 import paho.mqtt.client as mqtt
-from picamera2 import Picamera2
 import pygame
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+from email.message import EmailMessage
+from email.policy import SMTP as SMTP_POLICY
 from fall_detection_config import *
-from yolo_streamer_optimized import YOLOStreamer
+
+# Camera and AI worker threads run natively (see import_native)
+picamera2_native = import_native('picamera2')
+Picamera2 = picamera2_native.Picamera2
+MJPEGEncoder = picamera2_native.encoders.MJPEGEncoder
+FileOutput = picamera2_native.outputs.FileOutput
+YOLOStreamer = import_native('yolo_streamer_optimized').YOLOStreamer
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJPF_RGB
+    turbo_jpeg = TurboJPEG()
+except Exception as e: # PyTurboJPEG or libturbojpeg not installed
+    print(f"[VIDEO_FEED] TurboJPEG unavailable, using OpenCV JPEG encoder: {e}")
+    turbo_jpeg = None
+
+
+class OrjsonCodec:
+    """json-module shim so Socket.IO packets are serialized by orjson."""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    @staticmethod
+    def loads(data, **kwargs):
+        return orjson.loads(data)
+
+
+class NativeQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose worker is a real OS thread, so its blocking writes never stall the eventlet hub."""
+
+    def start(self):
+        self._thread = native_threading.Thread(target=self._monitor, daemon=True)
+        self._thread.start()
+
+# Hot-path log lines are handed to a queue and written by log_listener, so the
+# MQTT, monitor and video tasks never block on stdout. Both the queue and the
+# listener thread are native: a green listener would block the hub on every write.
+log_queue = native_queue.Queue()
+log_listener = NativeQueueListener(log_queue, logging.StreamHandler(sys.stdout))
+logger = logging.getLogger('fall_detection')
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+logger.setLevel(logging.INFO)
+logger.propagate = False
 
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'fall_detection_secret_2025'
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, async_mode='eventlet', cors_allowed_origins="*", json=OrjsonCodec)
 
 
 system_state = {
@@ -36,19 +103,140 @@ system_state = {
     'fall_detected_time': None,
     'alert_active': False,
     'emergency_active': False,
+    'person_present': False,
+    'person_fallen_by_pose': False,
+    'person_moving': False,
+    'motion_detected': False,
 
-    'sound_muted': False,
     'latest_snapshot': None,
-    'sensor_history': [],
+    'latest_snapshot_bytes': None, # JPEG behind latest_snapshot, kept in memory for the emergency email
+    'sensor_history': deque(maxlen=SENSOR_HISTORY_LENGTH),
 
 
 
 }
+# Guards the compound alert/emergency/status transitions in system_state
 state_lock = Lock()
+# Set once the user mutes the alarm; an Event so the audio path never takes state_lock
+sound_muted = Event()
+# Wakes the monitor thread as soon as YOLO or MQTT updates change the state
+monitor_cv = Condition(state_lock)
+state_version = 0 # Bumped on every change, so the monitor cannot miss a notify while it is emitting
+
+
+# Never sent to clients: raw JPEG bytes are for the email path only
+PRIVATE_STATE_KEYS = ('latest_snapshot_bytes',)
+
+def _project_state(state):
+    """Shallow copy of the state for broadcasting, sensor_history is sent only on request."""
+    snapshot = {key: value for key, value in state.items()
+                if key != 'sensor_history' and key not in PRIVATE_STATE_KEYS}
+    snapshot['sound_muted'] = sound_muted.is_set()
+    return snapshot
+
+def notify_state_changed():
+    """Bump state_version and wake the monitor. Caller must hold state_lock."""
+    global state_version
+    state_version += 1
+    monitor_cv.notify_all()
+
+def emit_events(events):
+    """Emit (event, payload) pairs collected under state_lock, after it was released."""
+    for event, payload in events:
+        socketio.emit(event, payload)
+
+def invalidate_status():
+    """Drop the cached /api/status payload so the next poll re-serializes. Caller must hold state_lock."""
+    global status_snapshot
+    status_snapshot = None
+
+status_snapshot = None # orjson bytes of system_state, built lazily by get_status
+
+# Dashboard events waiting for the next batched flush, keyed by event name (latest wins)
+pending_events = {}
+pending_lock = Lock()
+pending_ready = Event()
+last_emitted_state = {} # Last system_update the flusher sent, the base for deltas
+last_full_state_time = 0
+
+def enqueue_event(name, data):
+    """Queue a dashboard event; a newer event of the same name replaces an unsent one."""
+    with pending_lock:
+        pending_events[name] = data
+    pending_ready.set()
+
+def diff_state(state):
+    """Turn a queued full system_update into the smallest payload worth sending."""
+    global last_emitted_state, last_full_state_time
+    now = time.time()
+    if now - last_full_state_time >= STATE_KEYFRAME_INTERVAL:
+        # Periodic full state keeps clients in sync even if they missed a delta
+        last_full_state_time = now
+        last_emitted_state = state
+        return 'system_update', state
+    delta = {key: value for key, value in state.items()
+             if key not in last_emitted_state or last_emitted_state[key] != value}
+    last_emitted_state = state
+    return 'system_update_delta', delta
+
+def event_flusher():
+    """Emit queued dashboard events together as one state_batch per EMIT_BATCH_INTERVAL."""
+    global pending_events
+    while True:
+        pending_ready.wait()
+        # Give the other events of this burst time to coalesce into the same write
+        time.sleep(EMIT_BATCH_INTERVAL)
+        with pending_lock:
+            batch, pending_events = pending_events, {}
+            pending_ready.clear()
+
+        state = batch.pop('system_update', None)
+        if state is not None:
+            event, payload = diff_state(state)
+            if payload:
+                batch[event] = payload
+        if not batch:
+            continue
+        try:
+            socketio.emit('state_batch', batch)
+        except Exception as e:
+            print(f"[WEBSOCKET] Error flushing batched events: {e}")
+
+def broadcast_state(snapshot=None):
+    """Queue system_update for every dashboard client, serialized once for all of them."""
+    if snapshot is None:
+        with state_lock:
+            snapshot = _project_state(system_state)
+    enqueue_event('system_update', snapshot)
 
 
 picam2 = None
+yolo_streamer = None
 previous_frame = None # Will still be used for generic motion detection if no YOLO person
+snapshot_buffer = None # Preallocated in init_camera, reused by every snapshot
+snapshot_lock = Lock()
+
+# Latest encoded JPEG, shared by every video viewer so each frame is encoded once
+latest_jpeg = b''
+latest_part = None # latest_jpeg framed as a multipart part, built on first /video_feed read
+MJPEG_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MJPEG_SUFFIX = b'\r\n'
+jpeg_seq = 0
+jpeg_time = 0 # When latest_jpeg was published; it goes stale while the encoder idles
+jpeg_cond = Condition()
+hw_mjpeg = False # True once the Picamera2 hardware MJPEG encoder is feeding latest_jpeg
+hw_frames = native_queue.Queue(maxsize=1) # Encoder thread -> hw_frame_pump handoff, newest frame only
+
+# Live-video consumers; the software encoder idles while there are none
+active_clients = set() # Socket.IO sids of connected dashboards
+video_inflight = {} # sid -> when its last video_frame was sent, cleared by the client's ack
+VIDEO_ACK_TIMEOUT = 5.0 # Resend after this long, so a lost ack cannot stall a client for good
+video_feed_viewers = 0
+viewers_cond = Condition()
+
+def has_viewers():
+    """True if any dashboard or /video_feed client is watching. Caller must hold viewers_cond."""
+    return bool(active_clients) or video_feed_viewers > 0
 
 
 
@@ -56,21 +244,149 @@ previous_frame = None # Will still be used for generic motion detection if no YO
 
 mqtt_client = mqtt.Client(client_id="raspberry_pi_fall_detection")
 
+last_timestamp = (0, '') # (epoch second, formatted string), rebound as one tuple so readers never see a mix
+
+def iso_now():
+    """Local ISO timestamp at second precision, formatted once per wall-clock second."""
+    global last_timestamp
+    now_sec = int(time.time())
+    if now_sec != last_timestamp[0]:
+        last_timestamp = (now_sec, datetime.fromtimestamp(now_sec).isoformat())
+    return last_timestamp[1]
+
+def encode_jpeg(frame, rgb=False):
+    """Encode a BGR (or RGB if rgb=True) frame to JPEG bytes, using libjpeg-turbo's SIMD path when available."""
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(frame, quality=JPEG_QUALITY, pixel_format=TJPF_RGB if rgb else TJPF_BGR)
+    if rgb:
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buffer.tobytes() if ret else None
+
+def publish_jpeg(jpeg_bytes):
+    """Store a freshly encoded frame and wake every waiting viewer."""
+    global latest_jpeg, latest_part, jpeg_seq, jpeg_time
+    with jpeg_cond:
+        latest_jpeg = jpeg_bytes
+        latest_part = None
+        jpeg_seq += 1
+        jpeg_time = time.time()
+        jpeg_cond.notify_all()
+
+def get_latest_jpeg(since_seq, timeout=1.0):
+    """Wait for a frame newer than since_seq; returns (jpeg, seq), or (None, since_seq) on timeout."""
+    with jpeg_cond:
+        if not jpeg_cond.wait_for(lambda: jpeg_seq != since_seq, timeout=timeout):
+            return None, since_seq
+        return latest_jpeg, jpeg_seq
+
+def get_latest_part(since_seq, timeout=1.0):
+    """Like get_latest_jpeg, but returns the frame wrapped as one multipart part, framed once for all viewers."""
+    global latest_part
+    with jpeg_cond:
+        if not jpeg_cond.wait_for(lambda: jpeg_seq != since_seq, timeout=timeout):
+            return None, since_seq
+        if latest_part is None:
+            # One joined part rather than three yields: each yield is a separate chunked write per viewer
+            latest_part = b''.join((MJPEG_PREFIX, latest_jpeg, MJPEG_SUFFIX))
+        return latest_part, jpeg_seq
+
+class StreamingOutput(io.BufferedIOBase):
+    """File-like sink for the hardware MJPEG encoder, keeps only the latest frame."""
+
+    def write(self, buf):
+        # Runs on picamera2's native encoder thread, where green locks are unsafe:
+        # hand the frame to hw_frame_pump through a native queue, replacing any unread one
+        try:
+            hw_frames.get_nowait()
+        except native_queue.Empty:
+            pass
+        hw_frames.put_nowait(bytes(buf))
+        return len(buf)
+
+def native_get(q):
+    """Blocking get on a native queue, run on a tpool thread so the hub keeps running; None after 1s idle.
+
+    The timeout frees the tpool thread regularly, otherwise tpool's exit-time join would hang on it.
+    """
+    try:
+        return tpool.execute(q.get, True, 1.0)
+    except native_queue.Empty:
+        return None
+
+def hw_frame_pump():
+    """Publish hardware-encoded frames handed over by StreamingOutput."""
+    while True:
+        frame = native_get(hw_frames)
+        if frame is not None:
+            publish_jpeg(frame)
+
+class NativeEmitter:
+    """Stand-in for socketio handed to native-thread code: emits are queued for emit_pump.
+
+    Green queues are not woken by puts from another OS thread, so calling socketio.emit
+    from YOLOStreamer's native thread would stall or race the engine.io writer.
+    """
+
+    def __init__(self):
+        self.queue = native_queue.Queue()
+
+    def emit(self, event, *args, **kwargs):
+        self.queue.put((event, args, kwargs))
+
+native_emitter = NativeEmitter()
+
+def emit_pump():
+    """Forward events queued by native threads to Socket.IO."""
+    while True:
+        item = native_get(native_emitter.queue)
+        if item is None:
+            continue
+        event, args, kwargs = item
+        try:
+            socketio.emit(event, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"[WEBSOCKET] Error forwarding {event}: {e}")
+
 def init_camera():
     """Initialize Raspberry Pi camera"""
-    global picam2
-        try:
+    global picam2, hw_mjpeg, snapshot_buffer
+    try:
         picam2 = Picamera2()
+        snapshot_buffer = np.empty((CAMERA_RESOLUTION[1], CAMERA_RESOLUTION[0], 3), dtype=np.uint8)
 
-        config = picam2.create_still_configuration(
-            main={"size": CAMERA_RESOLUTION}
+        # main: same pixel format the still configuration delivered, so YOLO sees identical frames.
+        # lores: YUV420 copy made by the ISP, fed to the hardware JPEG encoder for the live feed
+        config = picam2.create_video_configuration(
+            main={"size": CAMERA_RESOLUTION, "format": "BGR888"},
+            lores={"size": STREAM_RESOLUTION, "format": "YUV420"}
         )
-        print(f"[CAMERA_DEBUG] Still configuration created: {CAMERA_RESOLUTION}")
+        print(f"[CAMERA_DEBUG] Video configuration created: main {CAMERA_RESOLUTION}, lores {STREAM_RESOLUTION}")
         picam2.configure(config)
 
+        encoder_started = False
+        try:
+            picam2.start_encoder(MJPEGEncoder(), FileOutput(StreamingOutput()), name="lores")
+            encoder_started = True
+            print("[CAMERA] Hardware MJPEG encoder attached")
+        except Exception as e:
+            print(f"[CAMERA] Hardware MJPEG unavailable, using software JPEG: {e}")
+
         picam2.start()
 
-    
+        if encoder_started:
+            # Only rely on the hardware path once it has actually produced a frame
+            try:
+                publish_jpeg(tpool.execute(hw_frames.get, True, 2.0))
+                hw_mjpeg = True
+                print("[CAMERA] Hardware MJPEG encoder is producing frames")
+            except native_queue.Empty:
+                print("[CAMERA] Hardware MJPEG encoder produced no frames, using software JPEG")
+                try:
+                    picam2.stop_encoder()
+                except Exception as e:
+                    print(f"[CAMERA] Error stopping hardware encoder: {e}")
+
         print("[CAMERA] Initialized successfully")
         return True
     except Exception as e:
@@ -78,8 +394,104 @@ def init_camera():
         import traceback
 
         return False
+snapshot_queue = queue.Queue()
+
+def sync_snapshots(files):
+    """fsync a batch of written snapshots and the folder entry, then close them."""
+    for f in files:
+        try:
+            tpool.execute(os.fsync, f.fileno())
+        except OSError as e:
+            print(f"[CAMERA] Error syncing snapshot {f.name}: {e}")
+        finally:
+            f.close()
+    try:
+        dir_fd = os.open(SNAPSHOT_FOLDER, os.O_RDONLY)
+        try:
+            tpool.execute(os.fsync, dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError as e:
+        print(f"[CAMERA] Error syncing snapshot folder {SNAPSHOT_FOLDER}: {e}")
+
+def snapshot_writer():
+    """Write queued snapshots to SNAPSHOT_FOLDER, fsyncing every SNAPSHOT_FSYNC_EVERY files."""
+    unsynced = []
+    while True:
+        try:
+            # Flush a partial batch once snapshots stop arriving
+            filepath, jpeg_bytes = snapshot_queue.get(timeout=5)
+        except queue.Empty:
+            if unsynced:
+                sync_snapshots(unsynced)
+                unsynced = []
+            continue
+
+        f = None
+        try:
+            f = open(filepath, 'wb', buffering=0)
+            view = memoryview(jpeg_bytes)
+            while view:
+                # Unbuffered writes may be short; keep going until the whole JPEG is written
+                view = view[f.write(view):]
+            unsynced.append(f)
+        except OSError as e:
+            print(f"[CAMERA] Error writing snapshot {filepath}: {e}")
+            if f is not None:
+                f.close()
+
+        if len(unsynced) >= SNAPSHOT_FSYNC_EVERY:
+            sync_snapshots(unsynced)
+            unsynced = []
+
+def detect_motion(frame):
+    """Generic frame-difference motion check, run on a small grayscale copy of the frame."""
+    global previous_frame
+    # Downscale first: every following per-pixel op then touches ~MOTION_FRAME_SIZE pixels only
+    small = cv2.resize(frame, MOTION_FRAME_SIZE, interpolation=cv2.INTER_AREA)
+    small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    if previous_frame is None:
+        previous_frame = small
+        return False
+
+    diff = cv2.absdiff(previous_frame, small)
+    previous_frame = small
+    _, mask = cv2.threshold(diff, MOTION_THRESHOLD, 255, cv2.THRESH_BINARY)
+    # MOTION_MIN_AREA is given in full-resolution pixels
+    min_pixels = MOTION_MIN_AREA * small.size / (frame.shape[0] * frame.shape[1])
+    return cv2.countNonZero(mask) > min_pixels
+
+def encode_snapshot_frame(frame):
+    """Encode a YOLO frame for a snapshot, staging it in the preallocated snapshot_buffer."""
+    with snapshot_lock:
+        if snapshot_buffer is not None and frame.shape == snapshot_buffer.shape:
+            # Stable copy without a new allocation: the streamer may replace its frame mid-encode
+            np.copyto(snapshot_buffer, frame)
+            frame = snapshot_buffer
+        # Native worker thread, so the encode does not stall the event loop
+        return tpool.execute(encode_jpeg, frame)
+
+def current_jpeg():
+    """JPEG of the current scene: the live JPEG if fresh, else an encode of the latest frame. Returns (bytes, source)."""
+    # The live feed already holds an encoded JPEG, reuse it instead of encoding again
+    with jpeg_cond:
+        jpeg_bytes = latest_jpeg if time.time() - jpeg_time <= 1.0 else b''
+    if jpeg_bytes:
+        return jpeg_bytes, "shared live JPEG"
+
+    frame_to_save = yolo_streamer.get_latest_frame() if yolo_streamer else None
+    if frame_to_save is not None:
+        return encode_snapshot_frame(frame_to_save), "latest frame from YOLOStreamer"
+
+    if picam2:
+        # Array view of the running main stream, no capture_request/release cycle.
+        # Picamera2's "BGR888" buffers are R, G, B ordered in memory.
+        # Capture inside the pool call too: capture_array blocks natively until the next frame
+        return tpool.execute(lambda: encode_jpeg(picam2.capture_array("main"), rgb=True)), "new frame from Picamera2"
+    return None, None
+
 def capture_snapshot(frame=None):
-    """Capture image from camera or save a provided frame."""
+    """Capture image from camera or save a provided frame. Returns (filename, jpeg_bytes), or (None, None)."""
     global picam2, yolo_streamer
 
     try:
@@ -89,153 +501,237 @@ def capture_snapshot(frame=None):
         
         os.makedirs(SNAPSHOT_FOLDER, exist_ok=True)
         
+        # Pick exactly one source so the file is encoded and written once
         if frame is not None:
+            jpeg_bytes = encode_snapshot_frame(frame)
+            source = "provided frame"
+        else:
+            jpeg_bytes, source = current_jpeg()
 
-            cv2.imwrite(filepath, frame)
-            print(f"[CAMERA_DEBUG] Saved provided frame to {filepath}")
-
-            if yolo_streamer and yolo_streamer.get_latest_frame() is not None:
-                frame_to_save = yolo_streamer.get_latest_frame()
-                cv2.imwrite(filepath, frame_to_save)
-                print(f"[CAMERA_DEBUG] Saved latest frame from YOLOStreamer to {filepath}")
-
-                request = picam2.capture_request()
-                request.save("main", filepath)
-                request.release()
-                print(f"[CAMERA_DEBUG] Captured new frame from Picamera2 to {filepath}")
-            else:
+        if not jpeg_bytes:
+            return None, None
 
-                return None
+        # Written by snapshot_writer; the name and bytes are returned now so UI/email never wait on the file
+        snapshot_queue.put((filepath, jpeg_bytes))
+        print(f"[CAMERA_DEBUG] Queued {source} for {filepath}")
             
         print(f"[CAMERA] Snapshot saved: {filename}")
-        return filename
+        return filename, jpeg_bytes
     except Exception as e:
         print(f"[CAMERA] Error capturing snapshot: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        return None, None
 
 
 def on_mqtt_connect(client, userdata, flags, rc, properties=None):
     """Callback when connected to MQTT broker"""
     if rc == 0:
         print("[MQTT] Connected successfully")
-        client.subscribe(MQTT_TOPIC_SENSOR)
-        client.subscribe(MQTT_TOPIC_ALERT)
-        client.subscribe(MQTT_TOPIC_STATUS)
+        # Sensor readings are superseded by the next one, so QoS 0 skips the ack round trip;
+        # alert/status transitions must not be lost and keep QoS 1
+        client.subscribe([(MQTT_TOPIC_SENSOR, 0), (MQTT_TOPIC_ALERT, 1), (MQTT_TOPIC_STATUS, 1)])
     else:
         print(f"[MQTT] Connection failed with code {rc}. See paho.mqtt.client documentation for details.")
 
-def on_mqtt_message(client, userdata, msg):
-    """Callback when MQTT message received"""
+def handle_device_message(payload, narrow):
+    """Apply an ESP32 message to system_state; narrow=True lets a plain reading go out as sensor_tick."""
     global system_state
+
+    # Only this thread appends, and deque.append is atomic under the GIL, so no lock.
+    # The bounded deque evicts the oldest entry on its own
+    system_state['sensor_history'].append({
+        'timestamp': iso_now(),
+        'data': payload
+    })
     
-    try:
-        payload = json.loads(msg.payload.decode())
-        topic = msg.topic
-        
-        print(f"[MQTT] Received on {topic}: {payload}")
-        
-        with state_lock:
+    events = []
+    with state_lock:
 
-                system_state['last_sensor_data'] = payload
-                system_state['sensor_history'].append({
-                    'timestamp': datetime.now().isoformat(),
-                    'data': payload
-                })
+        system_state['last_sensor_data'] = payload
 
-                if len(system_state['sensor_history']) > 100:
-                    system_state['sensor_history'].pop(0)
-                
+        handler = STATUS_HANDLERS.get(payload.get('status'))
+        if handler:
+            events = handler()
+            
+        new_status = payload.get('status', 'idle')
+        # Plain sensor frames only refresh the reading; anything else is a state transition
+        sensor_only = narrow and not handler and new_status == system_state['status']
+        system_state['status'] = new_status
+        invalidate_status()
+        if sensor_only:
+            snapshot = None
+        else:
+            # A plain reading changes nothing the monitor acts on, so only transitions wake it
+            notify_state_changed()
+            snapshot = _project_state(system_state)
+    
+    # Emit only after state_lock is released
+    emit_events(events)
+    if sensor_only:
+        enqueue_event('sensor_tick', {'last_sensor_data': payload})
+    else:
+        broadcast_state(snapshot)
 
-                if payload.get('status') == 'alert':
-                    handle_fall_alert()
-                elif payload.get('status') == 'emergency':
-                    handle_emergency()
-                elif payload.get('status') == 'cancelled':
-                    handle_alert_cancelled()
-                    
+def handle_sensor_message(payload):
+    """High-rate sensor feed: most frames only refresh the latest reading."""
+    handle_device_message(payload, narrow=True)
+
+def handle_state_message(payload):
+    """Alert/status topics: always rebroadcast the full state."""
+    handle_device_message(payload, narrow=False)
+
+# Subscribed topic -> message handler, looked up once per packet by on_mqtt_message
+TOPIC_HANDLERS = {
+    MQTT_TOPIC_SENSOR: handle_sensor_message,
+    MQTT_TOPIC_ALERT: handle_state_message,
+    MQTT_TOPIC_STATUS: handle_state_message,
+}
 
-                system_state['status'] = payload.get('status', 'idle')
+def on_mqtt_message(client, userdata, msg):
+    """Callback when MQTT message received"""
+    try:
+        payload = orjson.loads(msg.payload) # orjson parses the raw bytes, no decode() needed
+        topic = msg.topic
         
+        logger.info(f"[MQTT] Received on {topic}: {payload}")
 
-        socketio.emit('system_update', system_state)
+        handler = TOPIC_HANDLERS.get(topic)
+        if handler is None:
+            logger.warning(f"[MQTT] Ignoring message on unexpected topic {topic}")
+            return
+        handler(payload)
         
     except Exception as e:
-        print(f"[MQTT] Error processing message: {e}")
+        logger.error(f"[MQTT] Error processing message: {e}")
 
-def send_emergency_email(snapshot_filename):
-    """Send an emergency email with a snapshot attached"""
-    print("[EMAIL] Preparing to send emergency email...")
-
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_SENDER
-        msg['To'] = EMAIL_RECIPIENT
-        msg['Subject'] = "!! EMERGENCY ALERT: Fall Detected !!"
-        
+email_queue = queue.Queue()
 
-        body = f"""
+EMAIL_BODY = """
         A fall has been detected and the emergency state has been triggered.
         
-        Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        Timestamp: {timestamp}
         
         Please check on the person immediately.
         
         A snapshot from the camera is attached.
         """
-        msg.attach(MIMEText(body, 'plain'))
-        
 
-        if snapshot_filename:
-            filepath = os.path.join(SNAPSHOT_FOLDER, snapshot_filename)
-            if os.path.exists(filepath):
-                with open(filepath, 'rb') as attachment:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(attachment.read())
-                encoders.encode_base64(part)
-                part.add_header(
-                    'Content-Disposition',
-                    f'attachment; filename= {snapshot_filename}',
-                )
-                msg.attach(part)
-                print(f"[EMAIL] Attached snapshot: {snapshot_filename}")
+# Constant headers composed once; each email starts from a copy of this
+email_template = EmailMessage(policy=SMTP_POLICY)
+email_template['From'] = EMAIL_SENDER
+email_template['To'] = EMAIL_RECIPIENT
+email_template['Subject'] = "!! EMERGENCY ALERT: Fall Detected !!"
+
+class SMTPPool:
+    """Single authenticated SMTP session, connected lazily and reused across emergencies."""
+
+    def __init__(self):
+        self.conn = None
+        self.lock = Lock()
+
+    def get(self):
+        """Return the open session, reconnecting only if NOOP fails. Caller must hold self.lock."""
+        if self.conn is not None:
+            try:
+                self.conn.noop()
+                return self.conn
+            except (smtplib.SMTPException, OSError):
+                print("[EMAIL] SMTP session lost, reconnecting...")
+                self.conn = None
+
+        conn = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+        conn.starttls()
+        conn.login(EMAIL_SENDER, EMAIL_PASSWORD)
+        self.conn = conn
+        return conn
+
+    def discard(self):
+        """Drop the session so the next email reconnects."""
+        with self.lock:
+            self.conn = None
+
+    def close(self):
+        """Log out of the server, used at interpreter exit."""
+        with self.lock:
+            if self.conn is not None:
+                try:
+                    self.conn.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+                self.conn = None
+
+smtp_pool = SMTPPool()
+atexit.register(smtp_pool.close)
+
+def send_emergency_email(snapshot_bytes, snapshot_filename):
+    """Send an emergency email with the in-memory snapshot JPEG attached"""
+    print("[EMAIL] Preparing to send emergency email...")
+
+    try:
+        # deepcopy: a shallow copy would share (and mutate) the template's header list
+        msg = copy.deepcopy(email_template)
+        msg.set_content(EMAIL_BODY.format(timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         
 
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_SENDER, EMAIL_RECIPIENT, text)
-        server.quit()
+        if snapshot_bytes:
+            snapshot_filename = snapshot_filename or f"fall_snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+            msg.add_attachment(snapshot_bytes, maintype='image', subtype='jpeg',
+                               filename=snapshot_filename)
+            print(f"[EMAIL] Attached snapshot: {snapshot_filename}")
+        
+        # send_message serializes straight to bytes with CRLF endings, no intermediate str copy
+        with smtp_pool.lock:
+            server = smtp_pool.get()
+            server.send_message(msg)
         
         print(f"[EMAIL] Emergency email sent successfully to {EMAIL_RECIPIENT}")
         
     except Exception as e:
         print(f"[EMAIL] Failed to send email: {e}")
+        # Force a fresh session for the next email
+        smtp_pool.discard()
+
+def email_worker():
+    """Send queued emergency emails one at a time over the pooled SMTP session."""
+    while True:
+        snapshot_bytes, snapshot_filename = email_queue.get()
+        if snapshot_bytes is None:
+            snapshot_bytes, _ = current_jpeg()
+        send_emergency_email(snapshot_bytes, snapshot_filename)
+
+emergency_sound = None # Decoded once in main(), replayed on every alert
+audio_event = Event() # Set to have audio_worker (re)evaluate playback
 
 def play_emergency_sound():
     """Play the emergency alert sound at max volume, if not muted."""
-    with state_lock:
-        if system_state['sound_muted']:
-
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
-            print("[AUDIO] Sound is muted by user. Not playing.")
-            return
+    if sound_muted.is_set():
+        if emergency_sound and emergency_sound.get_num_channels():
+            emergency_sound.stop()
+        print("[AUDIO] Sound is muted by user. Not playing.")
+        return
             
     try:
-        # These operations are thread-safe so we can do them outside the lock
-        if not pygame.mixer.get_init():
-            pygame.mixer.init()
-        pygame.mixer.music.set_volume(1.0)  # Set volume to max
-        pygame.mixer.music.load("emergency_alert.mp3")
-        pygame.mixer.music.play()
-        print("[AUDIO] Playing emergency alert sound at max volume.")
+        # These operations are thread-safe, no state_lock needed
+        if emergency_sound is None:
+            print("[AUDIO] Emergency sound not loaded. Not playing.")
+            return
+        # play() returns immediately and the mixer plays it out, so no worker is needed
+        if emergency_sound.get_num_channels() == 0:
+            emergency_sound.play()
+            print("[AUDIO] Playing emergency alert sound at max volume.")
     except Exception as e:
         print(f"[AUDIO] Error playing sound: {e}")
 
+def audio_worker():
+    """Single owner of the mixer: play or stop the alert sound each time audio_event is set."""
+    while True:
+        audio_event.wait()
+        audio_event.clear()
+        play_emergency_sound()
+
 def handle_fall_alert():
-    """Handle fall alert from ESP32"""
+    """Handle fall alert from ESP32. Returns the events to emit once state_lock is released."""
     global system_state
     
     print("[ALERT] Fall detected! Starting monitoring...")
@@ -243,29 +739,45 @@ def handle_fall_alert():
     # No need for state_lock here, as on_mqtt_message already holds it
     system_state['alert_active'] = True
     system_state['status'] = 'alert'
-    system_state['fall_detected_time'] = datetime.now().isoformat()
+    system_state['fall_detected_time'] = iso_now()
+    # Until this fall's snapshot lands, an emergency email must not attach the previous incident's
+    system_state['latest_snapshot'] = None
+    system_state['latest_snapshot_bytes'] = None
     
-    # Capture snapshot
-
-    snapshot = capture_snapshot()
-
-    if snapshot:
-        # This state update also doesn't need a lock, it's covered by the parent lock in on_mqtt_message
-        system_state['latest_snapshot'] = snapshot
+    # Capture snapshot in its own task: it takes state_lock, which our caller holds until we return.
+    # The dashboard is notified once the snapshot is ready
+    socketio.start_background_task(handle_fall_snapshot, system_state['fall_detected_time'])
     
     # Start motion detection monitoring
 
-    Thread(target=monitor_motion_after_fall, daemon=True).start()
+    socketio.start_background_task(monitor_motion_after_fall)
     
+    return []
+
+def handle_fall_snapshot(fall_time):
+    """Capture and record the fall snapshot, then broadcast the fall alert (background task)."""
+    snapshot, snapshot_bytes = capture_snapshot()
+    with state_lock:
+        # Drop it if the alert was cancelled or superseded while we captured
+        if system_state['fall_detected_time'] != fall_time or \
+                not (system_state['alert_active'] or system_state['emergency_active']):
+            return
+        if snapshot:
+            system_state['latest_snapshot'] = snapshot
+            system_state['latest_snapshot_bytes'] = snapshot_bytes
+            invalidate_status()
+        state = _project_state(system_state)
+
     # Broadcast to web dashboard
     socketio.emit('fall_alert', {
         'message': 'Fall detected! Monitoring for movement...',
-        'timestamp': system_state['fall_detected_time'],
+        'timestamp': fall_time,
         'snapshot': snapshot
     })
+    broadcast_state(state)
 
 def handle_emergency():
-    """Handle emergency state (no cancel after timeout)"""
+    """Handle emergency state (no cancel after timeout). Returns the events to emit once state_lock is released."""
     global system_state
     
     print("[EMERGENCY] Emergency state activated!")
@@ -282,30 +794,34 @@ def handle_emergency():
     
 
     system_state['motion_detected'] = person_fallen_by_pose 
+    invalidate_status()
     
     print(f"[EMERGENCY_DEBUG] State set to 'emergency'. Person Present: {person_present}, Pose Fall: {person_fallen_by_pose}")
     
 
-    socketio.emit('emergency_alert', {
+    events = [('emergency_alert', {
         'message': 'EMERGENCY! No response detected!',
         'person_present': person_present,
         'person_fallen_by_pose': person_fallen_by_pose,
         'snapshot': system_state.get('latest_snapshot'),
         'sensor_data': system_state.get('last_sensor_data')
-    })
-    socketio.emit('system_update', system_state)
+    })]
+    broadcast_state(_project_state(system_state))
 
 
 
-    Thread(target=send_emergency_email, args=(system_state.get('latest_snapshot'),), daemon=True).start()
+    # Attach the snapshot's in-memory bytes rather than re-reading the file from disk;
+    # with no snapshot yet (None), email_worker attaches the current scene instead
+    email_queue.put((system_state['latest_snapshot_bytes'], system_state.get('latest_snapshot')))
     
 
-    Thread(target=play_emergency_sound, daemon=True).start()
+    audio_event.set()
+    return events
 
 
 def handle_alert_cancelled():
-    """Handle alert cancellation"""
-    global system_state, previous_frame
+    """Handle alert cancellation. Returns the events to emit once state_lock is released."""
+    global system_state
     
     print("[ALERT] Alert cancelled by user")
     # NOTE: This function is called from within on_mqtt_message, which already holds state_lock.
@@ -313,6 +829,8 @@ def handle_alert_cancelled():
     system_state['alert_active'] = False
     system_state['emergency_active'] = False
     system_state['status'] = 'idle'
+    system_state['latest_snapshot'] = None
+    system_state['latest_snapshot_bytes'] = None
 
 
     system_state['person_moving'] = False # Reset person_moving to False as it's no longer used for motion detection
@@ -322,132 +840,245 @@ def handle_alert_cancelled():
     print(f"[CANCEL_DEBUG] State set to 'idle'.")
     
 
-    socketio.emit('alert_cancelled', {
+    broadcast_state(_project_state(system_state))
+    return [('alert_cancelled', {
         'message': 'Alert cancelled successfully'
-    })
-    socketio.emit('system_update', system_state)
+    })]
 
 
+# ESP32 status value -> transition handler, dispatched by handle_device_message
+STATUS_HANDLERS = {
+    'alert': handle_fall_alert,
+    'emergency': handle_emergency,
+    'cancelled': handle_alert_cancelled,
+}
+
+
+def should_escalate(time_remaining, person_fallen_by_pose):
+    """Escalate an alert to EMERGENCY when a fall posture is seen in the last 10s of the countdown, or when it runs out."""
+    return time_remaining == 0 or (time_remaining <= 10 and person_fallen_by_pose)
+
 def monitor_motion_after_fall():
     """Monitor for motion (via YOLO) and take snapshots after fall detection or during emergency."""
-    global system_state, yolo_streamer
+    global system_state, yolo_streamer, previous_frame
     
-    print("[MOTION] Starting continuous monitoring for motion and snapshots (YOLO-based)...")
+    logger.info("[MOTION] Starting continuous monitoring for motion and snapshots (YOLO-based)...")
     
 
 
-    last_snapshot_time = time.time()
+    start_monitoring_time = time.time()
+    last_snapshot_time = start_monitoring_time
     last_sound_play_time = 0
+    last_detection = None
+    last_motion_update = None
+    last_motion_check = 0
+    generic_motion = False
+    previous_frame = None # Never diff against a frame from an earlier incident
+    seen_version = -1
+    wait_timeout = 0
     
     while True:
         try:
-            current_time = time.time()
-            with state_lock:
+            events = []
+            snapshot_frame = None
+            with monitor_cv:
+                # Releases state_lock while waiting; a state change wakes us early,
+                # otherwise we sleep until the next countdown tick, sound or snapshot is due
+                monitor_cv.wait_for(lambda: state_version != seen_version, timeout=wait_timeout)
+                seen_version = state_version
+
+                current_time = time.time()
                 alert_active_local = system_state['alert_active']
                 emergency_active_local = system_state['emergency_active']
                 
 
                 if not alert_active_local and not emergency_active_local:
-                    print("[MOTION] Monitoring stopped - neither alert nor emergency active. Breaking loop.")
+                    logger.info("[MOTION] Monitoring stopped - neither alert nor emergency active. Breaking loop.")
                     fall_condition_met_start_time = None # Reset
                     break
                 
                 # Get latest YOLO status and PoseNet status
                 person_present = system_state['person_present']
                 person_fallen_by_pose = system_state['person_fallen_by_pose']
-                print(f"[MOTION_THREAD_DEBUG] In loop: person_present={person_present}, person_fallen_by_pose={person_fallen_by_pose}")
+                if (person_present, person_fallen_by_pose) != last_detection:
+                    logger.info(f"[MOTION_THREAD_DEBUG] In loop: person_present={person_present}, person_fallen_by_pose={person_fallen_by_pose}")
+                    last_detection = (person_present, person_fallen_by_pose)
+
+                # One read per iteration, shared by motion detection and the snapshot below
+                frame = yolo_streamer.get_latest_frame() if yolo_streamer else None
+
+                # No person for YOLO to judge: fall back to generic motion in the frame.
+                # Checked on a fixed cadence, so every diff spans MOTION_CHECK_INTERVAL
+                # no matter how often state changes wake this loop
+                if person_present:
+                    generic_motion = False
+                    previous_frame = None # Restart the baseline once the person leaves the frame
+                elif frame is not None and current_time - last_motion_check >= MOTION_CHECK_INTERVAL:
+                    generic_motion = detect_motion(frame)
+                    last_motion_check = current_time
 
                 # === Handle Alert Countdown and Motion Update ===
                 if alert_active_local:
                     time_elapsed_overall = current_time - start_monitoring_time
                     time_remaining_overall = max(0, int(ALERT_TIMEOUT - time_elapsed_overall))
                     
-                    # Emergency Trigger Logic:
-                    # If we are in the last 10 seconds of the 30s countdown (time_remaining <= 10)
-                    # AND the AI detects a fall posture.
-                    if time_remaining_overall <= 10:
-
-
-                        if person_fallen_by_pose:
-                            print(f"[MOTION] Emergency Condition Met: Person fallen in last 10s (Time Remaining: {time_remaining_overall}s). Escalating to EMERGENCY.")
-                            handle_emergency()
+                    # Emergency Trigger Logic (see should_escalate)
+                    if should_escalate(time_remaining_overall, person_fallen_by_pose):
+                        if time_remaining_overall == 0:
+                            # As per user request: Always trigger emergency at the end of the countdown if not cancelled by user.
+                            logger.info("[MOTION] Timeout reached. Escalating to EMERGENCY (Forced).")
+                        else:
+                            logger.info(f"[MOTION] Emergency Condition Met: Person fallen in last 10s (Time Remaining: {time_remaining_overall}s). Escalating to EMERGENCY.")
+                        events.extend(handle_emergency())
+                        # Do NOT break here, loop must continue for emergency sound
 
-                    
 
-                    socketio.emit('motion_update', {
-                        'person_present': person_present,
-                        'person_fallen_by_pose': person_fallen_by_pose,
-                        'time_remaining_overall': time_remaining_overall,
-                        'time_remaining_fallen_motionless': time_remaining_overall 
-                    })
-                    print(f"[MOTION_DEBUG] Alert active. Time remaining: {time_remaining_overall}s. Person: {person_present}, Fall: {person_fallen_by_pose}")
-
-                    # If overall alert timeout reached without specific emergency conditions met, cancel alert
-                    if time_remaining_overall == 0:
-                        # As per user request: Always trigger emergency at the end of the countdown if not cancelled by user.
-                        print("[MOTION] Timeout reached. Escalating to EMERGENCY (Forced).")
-                        handle_emergency()
-                        # Do NOT break here, loop must continue for emergency sound
+                    # Only push motion_update when something the dashboard shows has changed
+                    motion_update = (person_present, person_fallen_by_pose, generic_motion, time_remaining_overall)
+                    if motion_update != last_motion_update:
+                        enqueue_event('motion_update', {
+                            'person_present': person_present,
+                            'person_fallen_by_pose': person_fallen_by_pose,
+                            'generic_motion': generic_motion,
+                            'time_remaining_overall': time_remaining_overall,
+                            'time_remaining_fallen_motionless': time_remaining_overall 
+                        })
+                        logger.info(f"[MOTION_DEBUG] Alert active. Time remaining: {time_remaining_overall}s. Person: {person_present}, Fall: {person_fallen_by_pose}")
+                        last_motion_update = motion_update
                     
                 # === Handle Emergency Sound ===
                 if emergency_active_local:
                     if current_time - last_sound_play_time >= 5:
-                        Thread(target=play_emergency_sound, daemon=True).start()
+                        audio_event.set()
                         last_sound_play_time = current_time
                     
                 # === Continuous Snapshots ===
+                # Only pick the frame here; the encode happens below, after state_lock is released
                 if current_time - last_snapshot_time >= 5:
-                    frame_to_save = yolo_streamer.get_latest_frame() if yolo_streamer else None
-                    if frame_to_save is not None:
-                        snapshot = capture_snapshot(frame=frame_to_save)
-                        if snapshot:
-                            system_state['latest_snapshot'] = snapshot
-                            socketio.emit('system_update', system_state) 
+                    snapshot_frame = frame
                     last_snapshot_time = current_time
+
+                # Next deadline: countdown second boundary, snapshot, or emergency sound (at most 1s away)
+                deadlines = [current_time + 1.0 - ((current_time - start_monitoring_time) % 1.0),
+                             last_snapshot_time + 5]
+                if emergency_active_local:
+                    deadlines.append(last_sound_play_time + 5)
+                if not person_present:
+                    deadlines.append(last_motion_check + MOTION_CHECK_INTERVAL)
+                wait_timeout = min(1.0, max(0.0, min(deadlines) - time.time()))
+
+            # Emit only after state_lock is released
+            emit_events(events)
+
+            if snapshot_frame is not None:
+                snapshot, snapshot_bytes = capture_snapshot(frame=snapshot_frame)
+                if snapshot:
+                    with state_lock:
+                        # The alert may have been cancelled while we encoded
+                        stored = system_state['alert_active'] or system_state['emergency_active']
+                        if stored:
+                            system_state['latest_snapshot'] = snapshot
+                            system_state['latest_snapshot_bytes'] = snapshot_bytes
+                            invalidate_status()
+                            state = _project_state(system_state)
+                    if stored:
+                        broadcast_state(state)
         
         except Exception as e:
-            print(f"[ERROR] Exception in monitor_motion_after_fall thread: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"[ERROR] Exception in monitor_motion_after_fall thread: {e}")
             break # Exit loop on error to prevent spinning
 
-        time.sleep(1) # Sleep for a shorter interval to allow frequent checks and non-blocking behavior
-
 
 
-def generate_frames():
-    """Generator function for video streaming."""
+def jpeg_encoder_loop():
+    """Software fallback for the hardware encoder: encode each YOLO frame once for all viewers."""
+    interval = 1.0 / STREAM_FPS
+    last_frame = None
     while True:
         try:
-            # Wait for a frame to be available from the YOLO streamer
+            with viewers_cond:
+                # Nobody is watching: sleep until a dashboard or /video_feed viewer arrives
+                viewers_cond.wait_for(has_viewers)
 
+            frame = yolo_streamer.get_latest_frame() if yolo_streamer else None
+            if frame is None:
                 time.sleep(0.5)
                 continue
 
-            frame = yolo_streamer.get_latest_frame()
-            
+            # Streamer has not produced a new frame yet, nothing to re-encode
+            if frame is not last_frame:
+                # Runs in a native worker thread so the encode does not stall the event loop
+                frame_bytes = tpool.execute(encode_jpeg, frame)
+                if frame_bytes:
+                    publish_jpeg(frame_bytes)
+                last_frame = frame
+        except Exception as e:
+            logger.error(f"[VIDEO_FEED] Error in JPEG encoder: {e}")
+            time.sleep(1)
+            continue
 
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-            if not ret:
+        time.sleep(interval)
+
+def video_broadcaster():
+    """Push each new shared JPEG to dashboard clients as a binary video_frame event."""
+    last_seq = 0
+    while True:
+        try:
+            frame_bytes, last_seq = get_latest_jpeg(last_seq)
+            if frame_bytes is None or not active_clients:
                 continue
-                
-            frame_bytes = buffer.tobytes()
+            now = time.time()
+            for sid in list(active_clients):
+                # One unacked frame per client: a slow dashboard skips frames instead of
+                # piling them up in its unbounded engine.io send queue
+                sent = video_inflight.get(sid)
+                if sent is not None and now - sent < VIDEO_ACK_TIMEOUT:
+                    continue
+                video_inflight[sid] = now
+                socketio.emit('video_frame', frame_bytes, to=sid,
+                              callback=lambda *args, sid=sid: video_inflight.pop(sid, None))
+        except Exception as e:
+            logger.error(f"[VIDEO_FEED] Error broadcasting frame: {e}")
+            time.sleep(1)
 
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+def generate_frames():
+    """Generator function for video streaming."""
+    global video_feed_viewers
+    with viewers_cond:
+        video_feed_viewers += 1
+        viewers_cond.notify_all()
+    try:
+        yield from stream_parts()
+    finally:
+        # Runs when the HTTP client goes away and the server closes the generator
+        with viewers_cond:
+            video_feed_viewers -= 1
+
+def stream_parts():
+    """Yield each new multipart part as the shared JPEG is updated."""
+    last_seq = 0
+    while True:
+        try:
+            # Every viewer yields the same framed part object, built once per frame;
+            # waiting for the next sequence number paces the stream
+            part, last_seq = get_latest_part(last_seq)
+            if part is None:
+                continue
+
+            yield part
             
 
 
 
         except Exception as e:
-            print(f"[VIDEO_FEED] Error in frame generator: {e}")
+            logger.error(f"[VIDEO_FEED] Error in frame generator: {e}")
 
 
             time.sleep(1)
 
 @app.route('/video_feed')
 def video_feed():
-    """Video streaming route."""
+    """Video streaming route (MJPEG over HTTP, for viewers outside the dashboard)."""
     return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
@@ -460,8 +1091,15 @@ def index():
 @app.route('/api/status')
 def get_status():
     """Get current system status"""
+    global status_snapshot
     with state_lock:
-        return jsonify(system_state)
+        # Serialize only after a change; repeat polls reuse the cached bytes
+        if status_snapshot is None:
+            public_state = {key: value for key, value in system_state.items() if key not in PRIVATE_STATE_KEYS}
+            public_state['sound_muted'] = sound_muted.is_set()
+            status_snapshot = orjson.dumps(public_state, default=list)
+        payload = status_snapshot
+    return Response(payload, mimetype='application/json')
 
 @app.route('/snapshots/<filename>')
 def get_snapshot(filename):
@@ -472,27 +1110,44 @@ def get_snapshot(filename):
 def handle_connect():
     """Handle client connection"""
     print("[WEBSOCKET] Client connected")
-    emit('system_update', system_state)
+    with viewers_cond:
+        active_clients.add(request.sid)
+        viewers_cond.notify_all()
+    with state_lock:
+        snapshot = _project_state(system_state)
+    emit('system_update', snapshot)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
     print("[WEBSOCKET] Client disconnected")
+    with viewers_cond:
+        active_clients.discard(request.sid)
+    video_inflight.pop(request.sid, None)
+
+@socketio.on('request_sensor_history')
+def handle_request_sensor_history():
+    """Send the sensor history to the requesting client only"""
+    with state_lock:
+        history = list(system_state['sensor_history'])
+    emit('sensor_history', history)
 
 @socketio.on('mute_sound')
 def handle_mute_sound():
     """Handle mute sound from dashboard"""
     print("[DASHBOARD] Mute sound received.")
+    sound_muted.set()
+    audio_event.set() # audio_worker sees the mute and stops playback
     with state_lock:
-        system_state['sound_muted'] = True
-        if pygame.mixer.music.get_busy():
-            pygame.mixer.music.stop()
-    emit('system_update', system_state, broadcast=True)
+        invalidate_status()
+    broadcast_state()
+
+last_emit_fingerprint = ()
 
 @socketio.on('yolo_detection_update')
 def handle_yolo_detection_update(data):
     """Handle YOLO detection updates from YOLOStreamer."""
-    global system_state
+    global system_state, last_emit_fingerprint
     with state_lock:
         if system_state['alert_active']:
             if data.get('person_detected', False):
@@ -510,7 +1165,18 @@ def handle_yolo_detection_update(data):
 
         system_state['motion_detected'] = system_state['person_fallen_by_pose']
 
-    emit('system_update', system_state, broadcast=True)
+        # Most detections repeat the previous result; skip the publish/broadcast for those
+        fingerprint = (system_state['person_present'], system_state['person_fallen_by_pose'],
+                       system_state['status'], system_state['alert_active'], system_state['emergency_active'])
+        if fingerprint == last_emit_fingerprint:
+            return
+        last_emit_fingerprint = fingerprint
+
+        invalidate_status()
+        notify_state_changed()
+        snapshot = _project_state(system_state)
+
+    broadcast_state(snapshot)
 
 
 
@@ -532,6 +1198,7 @@ def init_mqtt():
 
 def main():
     """Main application entry point"""
+    log_listener.start()
     print("=" * 60)
     print("Fall Detection System - Raspberry Pi")
     print("=" * 60)
@@ -541,9 +1208,12 @@ def main():
     os.makedirs('logs', exist_ok=True)
     
 
+    global emergency_sound
     try:
         pygame.init()
         pygame.mixer.init()
+        emergency_sound = pygame.mixer.Sound("emergency_alert.mp3")
+        emergency_sound.set_volume(1.0)  # Set volume to max
         print("[INFO] Pygame mixer initialized for audio alerts.")
     except Exception as e:
         print(f"[ERROR] Failed to initialize pygame: {e}")
@@ -560,7 +1230,8 @@ def main():
     global yolo_streamer
     try:
         print("[AI] Initializing YOLOStreamer...")
-        yolo_streamer = YOLOStreamer(picam2, socketio, YOLO_MODEL_PATH)
+        # Its inference thread is native, so it gets the queued emitter rather than socketio itself
+        yolo_streamer = YOLOStreamer(picam2, native_emitter, YOLO_MODEL_PATH)
         yolo_streamer.start()
         print("[AI] YOLOStreamer initialized and started successfully.")
     except Exception as e:
@@ -568,6 +1239,18 @@ def main():
         # We can continue without the streamer, but AI detection won't work
         yolo_streamer = None
 
+    if hw_mjpeg:
+        socketio.start_background_task(hw_frame_pump)
+    else:
+        socketio.start_background_task(jpeg_encoder_loop)
+
+    socketio.start_background_task(email_worker)
+    socketio.start_background_task(audio_worker)
+    socketio.start_background_task(snapshot_writer)
+    socketio.start_background_task(event_flusher)
+    socketio.start_background_task(video_broadcaster)
+    socketio.start_background_task(emit_pump)
+
 
     if not init_mqtt():
         print("[ERROR] Failed to connect to MQTT broker!")
@@ -589,6 +1272,7 @@ def main():
             yolo_streamer.stop()
         if picam2:
             picam2.stop()
+        log_listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file